@@ -0,0 +1,48 @@
+"""Compares the disk size and scan throughput of downloaded posts in every data compression format.
+
+Run this from the same directory as your config after downloading posts: `python benchmarks/archive.py`
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from rich import print as rich_print
+from rich.table import Table
+
+from tumblrbot.utils.archive import SUFFIXES, read_lines, rewrite_archive
+from tumblrbot.utils.common import config, localize_number
+from tumblrbot.utils.models import Post
+
+
+def main() -> None:
+    suffixes = tuple(SUFFIXES.values())
+    data_paths = sorted(path for path in config.data_directory.iterdir() if path.name.endswith(suffixes) and ".shard" not in path.name) if config.data_directory.exists() else []
+    if not data_paths:
+        rich_print("No downloaded posts found! [italic]Hint: Try downloading your latest posts...")
+        return
+
+    table = Table("Compression", "Size (MB)", "Posts", "Scan (s)", "Posts/s", "MB/s")
+    with TemporaryDirectory() as directory:
+        for compression, suffix in SUFFIXES.items():
+            paths = [Path(directory, f"{index}{suffix}") for index in range(len(data_paths))]
+            for data_path, path in zip(data_paths, paths, strict=True):
+                rewrite_archive(data_path, path)
+
+            size = sum(path.stat().st_size for path in paths) / 1024 / 1024
+
+            post_count = 0
+            start = perf_counter()
+            for path in paths:
+                for line in read_lines(path):
+                    Post.model_validate_json(line)
+                    post_count += 1
+            elapsed = perf_counter() - start
+
+            table.add_row(compression, f"{size:.2f}", localize_number(post_count), f"{elapsed:.2f}", localize_number(round(post_count / elapsed)), f"{size / elapsed:.2f}")
+
+    rich_print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
+from argparse import ArgumentParser, Namespace
 from collections.abc import Callable, Mapping
+from datetime import datetime
 from functools import partial
 from locale import LC_ALL, setlocale
 from pathlib import Path
+from random import uniform
 from shutil import rmtree
 from sys import exit as sys_exit
 from sys import maxsize
+from time import sleep
 from typing import TYPE_CHECKING, Any, cast
 
 from openai import BadRequestError, OpenAI
@@ -16,8 +20,9 @@ from tumblrbot.actions.download import PostDownloader
 from tumblrbot.actions.examples import ExamplesWriter
 from tumblrbot.actions.fine_tune import FineTuner
 from tumblrbot.actions.generate import DraftGenerator
-from tumblrbot.utils.common import TumblrBotError, config, console, error_console
+from tumblrbot.utils.common import TumblrBotError, config, console, error_console, localize_number
 from tumblrbot.utils.models import Config, Tokens
+from tumblrbot.utils.profiling import is_profiling_enabled, run_profiled
 from tumblrbot.utils.tumblr import TumblrSession
 
 if TYPE_CHECKING:
@@ -26,24 +31,58 @@ if TYPE_CHECKING:
     from questionary.prompts.common import Choices, FormattedText
 
 
+ACTION_NAMES = ("download", "migrate", "compact", "examples", "filter", "fine-tune", "generate", "upload")
+
+
 def main() -> None:
     install()
     setlocale(LC_ALL, "")
 
+    arguments = parse_arguments()
+
     tokens = Tokens.load()
 
+    # The clients and user information are only set up once, no matter how many times actions are run.
     with OpenAI(api_key=tokens.openai_api_key, max_retries=maxsize) as openai, TumblrSession(tokens) as tumblr:
         config.update_fields(tumblr.get_user_information().response.user)
 
         post_downloader = PostDownloader(openai, tumblr)
         examples_writer = ExamplesWriter(openai, tumblr)
-        fine_tuner = FineTuner(openai, tumblr)
+        fine_tuner = FineTuner(openai, tumblr, interactive=arguments.command is None)
         draft_generator = DraftGenerator(openai, tumblr)
 
+        actions: dict[str, Callable[[], Any]] = dict(
+            zip(
+                ACTION_NAMES,
+                (
+                    post_downloader.main,
+                    post_downloader.migrate,
+                    post_downloader.compact,
+                    examples_writer.main,
+                    examples_writer.filter_examples,
+                    fine_tuner.main,
+                    draft_generator.main,
+                    draft_generator.upload,
+                ),
+                strict=True,
+            ),
+        )
+
+        match arguments.command:
+            case "run":
+                # A failed action exits with a non-zero status, so whatever started this program can tell that it failed.
+                if not maid_error_cleanup([actions[name] for name in arguments.actions]):
+                    sys_exit(1)
+                return
+            case "schedule":
+                run_schedule([actions[name] for name in arguments.actions], arguments.interval, arguments.jitter)
+                return
+
         while True:
             delete_choices = [
                 create_delete_choice("Delete downloaded posts", "Delete all downloaded posts.", config.data_directory),
                 create_delete_choice("Delete training data", "Delete generated training data.", config.training_data_file),
+                create_delete_choice("Delete generated drafts", "Delete generated drafts that have not been uploaded.", config.draft_spool_file),
             ]
 
             reset_choices = [
@@ -53,10 +92,13 @@ def main() -> None:
 
             choices = [
                 Choice("Download latest posts", post_downloader.main, description="Download latest posts from blogs."),
+                Choice("Migrate downloaded posts", post_downloader.migrate, description="Convert downloaded posts to the configured data compression."),
+                Choice("Compact downloaded posts", post_downloader.compact, description="Remove everything from downloaded posts that is not used by this program."),
                 Choice("Create training data", examples_writer.main, description="Create training data file that can be used to fine-tune a model."),
                 Choice("Filter training data", examples_writer.filter_examples, description="Remove training data flagged by OpenAI. May fix errors with fine-tuning validation."),
                 Choice("Fine-tune model", fine_tuner.main, description="Resume monitoring the previous fine-tuning process." if config.job_id else "Upload data to OpenAI and start fine-tuning."),
                 Choice("Generate drafts", draft_generator.main, description="Generate and upload posts to the bot's drafts."),
+                Choice("Upload drafts", draft_generator.upload, description="Upload drafts that were generated but not uploaded yet."),
                 create_submenu_choice("Delete saved data", delete_choices),
                 create_submenu_choice("Reset settings", reset_choices, should_exit_on_success=True),
                 Choice("Quit", sys_exit, description="Quit this program."),
@@ -77,17 +119,51 @@ def main() -> None:
             maid_error_cleanup(selected)
 
 
-def maid_error_cleanup(selected: list[Callable[[], Any]]) -> None:
+def parse_arguments() -> Namespace:
+    parser = ArgumentParser(description="An updated bot that posts to Tumblr, based on your very own blog! Run without a command to choose actions from a menu.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="Run actions once without any menus, then quit.")
+    run_parser.add_argument("actions", nargs="+", choices=ACTION_NAMES, help="The actions to run, in order.")
+
+    schedule_parser = subparsers.add_parser("schedule", help="Run actions repeatedly without any menus, waiting between each run.")
+    schedule_parser.add_argument("actions", nargs="+", choices=ACTION_NAMES, help="The actions to run, in order.")
+    schedule_parser.add_argument("--interval", type=float, default=config.schedule_interval, help="The number of seconds to wait after each run. Defaults to schedule_interval from the config.")
+    schedule_parser.add_argument("--jitter", type=float, default=config.schedule_jitter, help="The maximum number of seconds randomly added to or removed from each wait. Defaults to schedule_jitter from the config.")
+
+    return parser.parse_args()
+
+
+def run_schedule(selected: list[Callable[[], Any]], interval: float, jitter: float) -> None:
+    while True:
+        console.rule(f"Scheduled run started at {datetime.now().astimezone():%c}")
+
+        try:
+            maid_error_cleanup(selected)
+        except Exception:  # noqa: BLE001 # A failed run should not stop every run after it.
+            error_console.print_exception()
+
+        delay = max(0, interval + uniform(-jitter, jitter))  # noqa: S311
+        console.print(f"[gray62]Waiting {localize_number(round(delay))} seconds until the next run...")
+        sleep(delay)
+
+
+def maid_error_cleanup(selected: list[Callable[[], Any]]) -> bool:
+    # Returns whether every action completed without an error.
     try:
         for selection in selected:
-            selection()
+            if is_profiling_enabled():
+                run_profiled(selection)
+            else:
+                selection()
     except TumblrBotError as e:
         error_console.print(*e.args)
+        return False
     except FileNotFoundError as e:
         if e.filename == str(config.training_data_file):
             error_console.print("Training data not found! [italic]Hint: Try creating training data...")
-        else:
-            raise
+            return False
+        raise
     except BadRequestError as e:
         if isinstance(e.body, Mapping):
             e.body = cast("Mapping[str, str]", e.body)  # pyright: ignore[reportUnknownMemberType]
@@ -96,6 +172,9 @@ def maid_error_cleanup(selected: list[Callable[[], Any]]) -> None:
         if hasattr(e, "__notes__"):
             for note in e.__notes__:
                 error_console.print(note)
+        return False
+
+    return True
 
 
 def create_submenu_choice(verb: str, choices: Choices[Path], *, should_exit_on_success: bool = False) -> Choice[partial[None]]:
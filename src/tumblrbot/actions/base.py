@@ -4,12 +4,15 @@ from typing import TYPE_CHECKING
 
 from openai import OpenAI  # noqa: TC002
 
+from tumblrbot.utils.archive import SUFFIXES
 from tumblrbot.utils.common import config
 from tumblrbot.utils.tumblr import TumblrSession  # noqa: TC001
 
 if TYPE_CHECKING:
     from pathlib import Path
 
+    from tumblrbot.utils.archive import Compression
+
 
 @dataclass(frozen=True)
 class BaseAction:
@@ -22,5 +25,9 @@ class BaseAction:
     def get_data_paths(self) -> list[Path]:
         return list(map(self.get_data_path, config.download_blog_identifiers))
 
-    def get_data_path(self, blog_identifier: str) -> Path:
-        return (config.data_directory / blog_identifier).with_suffix(".jsonl")
+    def get_data_path(self, blog_identifier: str, compression: Compression | None = None) -> Path:
+        return config.data_directory / f"{blog_identifier}{SUFFIXES[compression or config.data_compression]}"
+
+    def get_other_data_paths(self, blog_identifier: str) -> list[Path]:
+        # Data that was downloaded with a different compression setting.
+        return [path for compression in SUFFIXES if compression != config.data_compression and (path := self.get_data_path(blog_identifier, compression)).exists()]
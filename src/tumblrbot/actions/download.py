@@ -1,12 +1,24 @@
-from json import dump
+from concurrent.futures import ThreadPoolExecutor
+from itertools import pairwise
+from json import dumps, loads
+from shutil import copyfileobj
+from time import time
 from typing import TYPE_CHECKING, override
 
+from rich import print as rich_print
+
 from tumblrbot.actions.base import BaseAction
-from tumblrbot.utils.common import PreviewLive, config
+from tumblrbot.utils.archive import append_archive, repair_archive, rewrite_archive
+from tumblrbot.utils.common import PreviewLive, TumblrBotError, config
 from tumblrbot.utils.models import Post
 
 if TYPE_CHECKING:
-    from io import TextIOBase
+    from pathlib import Path
+
+    from rich.progress import TaskID
+
+# The most windows downloaded at the same time. More windows than this are queued, since every request shares one session and one rate limit.
+MAX_DOWNLOAD_WORKERS = 10
 
 
 class PostDownloader(BaseAction):
@@ -16,41 +28,133 @@ class PostDownloader(BaseAction):
 
         with PreviewLive() as live:
             for blog_identifier in config.download_blog_identifiers:
+                if other_data_paths := self.get_other_data_paths(blog_identifier):
+                    msg = f"Found '{other_data_paths[0]}', which does not match the configured data compression! [italic]Hint: Try migrating downloaded posts..."
+                    raise TumblrBotError(msg)
+
                 data_path = self.get_data_path(blog_identifier)
+                task_id = live.progress.add_task(f"Downloading posts from '{blog_identifier}'...", total=None)
 
-                completed = 0
-                after = 0
-                if data_path.exists():
-                    lines = data_path.read_bytes().splitlines() if data_path.exists() else []
-                    completed = len(lines)
-                    if lines:
-                        after = Post.model_validate_json(lines[-1]).timestamp
-
-                with data_path.open("a", encoding="utf_8") as fp:
-                    self.paginate_posts(
-                        blog_identifier,
-                        completed,
-                        after,
-                        fp,
-                        live,
-                    )
-
-    def paginate_posts(self, blog_identifier: str, completed: int, after: int, fp: TextIOBase, live: PreviewLive) -> None:
-        task_id = live.progress.add_task(f"Downloading posts from '{blog_identifier}'...", total=None, completed=completed)
+                if self.get_shard_manifest_path(blog_identifier).exists() or (config.download_shards > 1 and not data_path.exists()):
+                    self.download_shards(blog_identifier, data_path, live, task_id)
+
+                # This also picks up any posts made after a sharded download started.
+                completed, after = self.get_resume_point(data_path)
+                live.progress.update(task_id, completed=completed)
+                self.paginate_posts(
+                    blog_identifier,
+                    after,
+                    data_path,
+                    live,
+                    task_id,
+                )
 
+    def get_resume_point(self, data_path: Path) -> tuple[int, int]:
+        # Returns the number of posts already downloaded and the timestamp to continue downloading after.
+        if data_path.exists():
+            completed, last_line = repair_archive(data_path)
+            if last_line is not None:
+                return completed, Post.model_validate_json(last_line).timestamp
+        return 0, 0
+
+    def paginate_posts(self, blog_identifier: str, after: int, data_path: Path, live: PreviewLive, task_id: TaskID, before: int | None = None) -> None:
         while True:
             response = self.tumblr.retrieve_published_posts(blog_identifier, after=after)
-            live.progress.update(task_id, total=response.response.blog.posts, completed=completed)
+            live.progress.update(task_id, total=response.response.blog.posts)
+
+            posts = response.response.posts if before is None else [post for post in response.response.posts if post["timestamp"] <= before]
+            if not posts:
+                return
+
+            # Each page is appended as one batch, so a crash can only lose the page being written.
+            append_archive(data_path, (dumps(post).encode() for post in (map(Post.project, posts) if config.project_post_data else posts)))
+
+            # Only the last post is needed to continue and any earlier previews would be replaced before being shown.
+            model = Post.model_validate(posts[-1])
+            after = model.timestamp
+            live.custom_update(model)
+
+            live.progress.advance(task_id, len(posts))
 
-            if not response.response.posts:
+            if len(posts) < len(response.response.posts):
                 return
 
-            for post in response.response.posts:
-                dump(post, fp)
-                fp.write("\n")
+    def download_shards(self, blog_identifier: str, data_path: Path, live: PreviewLive, task_id: TaskID) -> None:
+        # Downloading is a chain of requests that each depend on the last one, which is slow for large blogs.
+        # Splitting the blog into time windows allows each window to be downloaded in parallel as its own chain.
+        manifest_path = self.get_shard_manifest_path(blog_identifier)
+        if manifest_path.exists():
+            boundaries: list[int] = loads(manifest_path.read_bytes())
+        else:
+            boundaries = self.get_shard_boundaries(blog_identifier)
+            manifest_path.write_text(dumps(boundaries), encoding="utf_8")
+
+        # Each shard contains the posts after its start boundary, up to and including its end boundary.
+        # The last shard is left open-ended, in case a post is made while downloading.
+        shards = [
+            (self.get_data_path(f"{blog_identifier}.shard{index}"), start, end if index < len(boundaries) - 2 else None)
+            for index, (start, end) in enumerate(pairwise(boundaries))
+        ]
+        with ThreadPoolExecutor(min(len(shards), MAX_DOWNLOAD_WORKERS)) as executor:
+            for future in [executor.submit(self.download_shard, blog_identifier, *shard, live, task_id) for shard in shards]:
+                future.result()
+
+        # The shards are in order, so concatenating them gives the same file as a normal download.
+        # This works for compressed data as well, since the frames in each file are independent.
+        temporary_path = data_path.with_name(f"{data_path.name}.tmp")
+        with temporary_path.open("wb") as fp:
+            for shard_path, _, _ in shards:
+                if shard_path.exists():
+                    with shard_path.open("rb") as shard_fp:
+                        copyfileobj(shard_fp, fp)
+        temporary_path.replace(data_path)
+
+        # The manifest is removed first, so the shards are never partially removed while it still exists.
+        manifest_path.unlink()
+        for shard_path, _, _ in shards:
+            shard_path.unlink(missing_ok=True)
+
+    def download_shard(self, blog_identifier: str, shard_path: Path, after: int, before: int | None, live: PreviewLive, task_id: TaskID) -> None:
+        completed, resume_after = self.get_resume_point(shard_path)
+        live.progress.advance(task_id, completed)
+        self.paginate_posts(blog_identifier, resume_after or after, shard_path, live, task_id, before)
+
+    def get_shard_boundaries(self, blog_identifier: str) -> list[int]:
+        blog = self.tumblr.retrieve_blog_info(blog_identifier).response.blog
+        # Posts are returned oldest first, so the first post returned is the oldest one.
+        oldest_posts = self.tumblr.retrieve_published_posts(blog_identifier, after=0).response.posts
+        start = Post.model_validate(oldest_posts[0]).timestamp - 1 if oldest_posts else 0
+        end = max(blog.updated or int(time()), start + 1)
+
+        step = (end - start) / config.download_shards
+        return [start + round(step * index) for index in range(config.download_shards)] + [end]
+
+    def get_shard_manifest_path(self, blog_identifier: str) -> Path:
+        return config.data_directory / f"{blog_identifier}.shards.json"
+
+    def migrate(self) -> None:
+        for blog_identifier in config.download_blog_identifiers:
+            data_path = self.get_data_path(blog_identifier)
+            for other_data_path in self.get_other_data_paths(blog_identifier):
+                if data_path.exists():
+                    msg = f"Both '{other_data_path}' and '{data_path}' exist! [italic]Hint: Try deleting one of them..."
+                    raise TumblrBotError(msg)
+
+                rich_print(f"[gray62]Converting '{other_data_path}' to '{data_path}'...")
+                rewrite_archive(other_data_path, data_path)
+                other_data_path.unlink()
+
+        rich_print("[gray62]Completed!")
+
+    def compact(self) -> None:
+        for data_path in self.get_data_paths():
+            if data_path.exists():
+                rich_print(f"[gray62]Compacting '{data_path}'...")
+                # The file is rewritten with the compression of its own name, so compressed files stay compressed.
+                rewrite_archive(data_path, data_path, self.project_line)
 
-                model = Post.model_validate(post)
-                after = model.timestamp
-                live.custom_update(model)
+        rich_print("[gray62]Completed!")
 
-            completed += len(response.response.posts)
+    @staticmethod
+    def project_line(line: bytes) -> bytes:
+        return dumps(Post.project(loads(line))).encode()
@@ -1,23 +1,30 @@
+from collections import deque
 from collections.abc import Generator
-from itertools import batched
+from heapq import heappop, heappush
+from itertools import batched, count
 from json import loads
 from math import ceil
-from re import IGNORECASE
-from re import compile as re_compile
 from typing import TYPE_CHECKING, override
 
 from rich import print as rich_print
 
 from tumblrbot.actions.base import BaseAction
-from tumblrbot.utils.common import PreviewLive, TumblrBotError, config, localize_number, warning_console
+from tumblrbot.utils.archive import read_lines
+from tumblrbot.utils.common import PreviewLive, TumblrBotError, config, get_token_encoding, localize_number, warning_console
+from tumblrbot.utils.filters import WordFilter
 from tumblrbot.utils.models import Example, Message, Post
 
 if TYPE_CHECKING:
-    from collections.abc import Generator, Iterable
+    from collections.abc import Generator, Iterable, Iterator
     from pathlib import Path
 
     from openai._types import SequenceNotStr
     from openai.types import ModerationCreateResponse, ModerationMultiModalInputParam
+    from tiktoken import Encoding
+
+# The priority of an example, the number of tokens it uses, and the example itself.
+# The last element of the priority is always the position of the example in the data, which makes every priority unique.
+BudgetItem = tuple[tuple[int, ...], int, Example]
 
 
 class ExamplesWriter(BaseAction):
@@ -27,8 +34,19 @@ class ExamplesWriter(BaseAction):
 
         config.training_data_file.parent.mkdir(parents=True, exist_ok=True)
 
+        word_filter = WordFilter(config.filtered_words)
+
         examples = [self.create_example(*prompt) for prompt in self.get_custom_prompts()]
-        examples.extend(self.create_example(config.user_message, str(post)) for post in self.get_valid_posts())
+        if token_budget := self.get_token_budget():
+            encoding = get_token_encoding()
+            # Custom prompts are always included, so they use up the budget first.
+            remaining_budget = token_budget - sum(example.count_tokens(encoding) for example in examples)
+            examples.extend(self.get_budgeted_examples(max(remaining_budget, 0), encoding, word_filter))
+        else:
+            examples.extend(self.create_example(config.user_message, str(post)) for post in self.get_valid_posts(word_filter))
+
+        for word, match_count in word_filter.matches.most_common():
+            rich_print(f"[gray62]Filtered out {localize_number(match_count)} post(s) matching '{word}'.")
 
         if examples:
             self.write_examples(examples)
@@ -63,22 +81,69 @@ class ExamplesWriter(BaseAction):
             for example in examples:
                 fp.write(f"{example.model_dump_json()}\n")
 
-    def get_valid_posts(self) -> Generator[Post]:
+    def get_valid_posts(self, word_filter: WordFilter) -> Generator[Post]:
+        for path in self.get_data_paths():
+            if path.exists():
+                yield from self.get_limited_posts_from_path(path, word_filter)
+            else:
+                warning_console.print(f"{path} does not exist!")
+
+    def get_token_budget(self) -> int:
+        budgets: list[int] = []
+        if config.token_budget:
+            budgets.append(config.token_budget)
+        if config.cost_budget:
+            budgets.append(int(config.cost_budget / config.token_price * 1000000 / config.expected_epochs))
+        return min(budgets, default=0)
+
+    def get_budgeted_examples(self, token_budget: int, encoding: Encoding, word_filter: WordFilter) -> list[Example]:
+        positions = count()
+        candidates: list[BudgetItem] = []
         for path in self.get_data_paths():
             if path.exists():
-                posts = list(self.get_valid_posts_from_path(path))
-                yield from posts[-config.post_limit :]
+                # No single blog can use more than the whole budget, so each blog is trimmed on its own first.
+                # This keeps memory bounded by the budget instead of by the size of the downloaded data.
+                items = self.get_budget_items(path, positions, encoding, word_filter)
+                # Sorting the newest posts first gives each post its rank within its blog.
+                for rank, (priority, tokens, example) in enumerate(sorted(self.select_within_budget(items, token_budget), reverse=True)):
+                    candidates.append(((-rank, *priority) if config.budget_priority == "balanced" else priority, tokens, example))
             else:
                 warning_console.print(f"{path} does not exist!")
 
-    def get_valid_posts_from_path(self, path: Path) -> Generator[Post]:
+        selected = self.select_within_budget(candidates, token_budget)
+        rich_print(f"Selected {localize_number(len(selected))} posts using {localize_number(sum(tokens for _, tokens, _ in selected))} of {localize_number(token_budget)} available tokens.")
+        return [example for _, _, example in sorted(selected, key=lambda item: item[0][-1])]
+
+    def get_budget_items(self, path: Path, positions: Iterator[int], encoding: Encoding, word_filter: WordFilter) -> Generator[BudgetItem]:
+        for post in self.get_limited_posts_from_path(path, word_filter):
+            example = self.create_example(config.user_message, str(post))
+            yield (post.timestamp, next(positions)), example.count_tokens(encoding), example
+
+    @staticmethod
+    def select_within_budget(items: Iterable[BudgetItem], token_budget: int) -> list[BudgetItem]:
+        # Keeps the highest priority items that fit in the budget by discarding the lowest priority items whenever the budget is exceeded.
+        # Items that could never fit are skipped, since they would otherwise discard everything before being discarded themselves.
+        heap: list[BudgetItem] = []
+        total_tokens = 0
+        for item in items:
+            if item[1] > token_budget:
+                continue
+            heappush(heap, item)
+            total_tokens += item[1]
+            while total_tokens > token_budget:
+                total_tokens -= heappop(heap)[1]
+        return heap
+
+    def get_limited_posts_from_path(self, path: Path, word_filter: WordFilter) -> Iterable[Post]:
+        posts = self.get_valid_posts_from_path(path, word_filter)
+        return deque(posts, config.post_limit) if config.post_limit else posts
+
+    def get_valid_posts_from_path(self, path: Path, word_filter: WordFilter) -> Generator[Post]:
         earliest_timestamp = config.date_limit.timestamp()
-        pattern = re_compile("|".join(config.filtered_words), IGNORECASE)
-        with path.open("rb") as fp:
-            for line in fp:
-                post = Post.model_validate_json(line)
-                if post.valid_text_post() and post.timestamp >= earliest_timestamp and not (post.trail and config.filtered_words and pattern.search(str(post))):
-                    yield post
+        for line in read_lines(path):
+            post = Post.model_validate_json(line)
+            if post.valid_text_post() and post.timestamp >= earliest_timestamp and not (post.trail and word_filter and word_filter.search(str(post))):
+                yield post
 
     def filter_examples(self) -> None:
         raw_examples = config.training_data_file.read_bytes().splitlines()
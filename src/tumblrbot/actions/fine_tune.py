@@ -1,18 +1,21 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime
+from hashlib import file_digest
 from locale import currency, localeconv
+from math import ceil
 from textwrap import dedent
 from time import sleep
 from typing import TYPE_CHECKING, override
 
 from currency_converter import CurrencyConverter
-from openai import BadRequestError
+from openai import BadRequestError, NotFoundError
 from rich import print as rich_print
 from rich.progress import open as progress_open
 from rich.prompt import Confirm
-from tiktoken import encoding_for_model, get_encoding
 
 from tumblrbot.actions.base import BaseAction
-from tumblrbot.utils.common import PreviewLive, TumblrBotError, config, localize_number, warning_console
+from tumblrbot.utils.common import PreviewLive, TumblrBotError, config, get_token_encoding, localize_number
 from tumblrbot.utils.models import Example
 
 if TYPE_CHECKING:
@@ -20,8 +23,16 @@ if TYPE_CHECKING:
 
     from openai.types.fine_tuning import FineTuningJob
 
+# The largest part allowed by the OpenAI Uploads API. Smaller files are uploaded in a single request.
+UPLOAD_PART_SIZE = 64 * 1024 * 1024
+UPLOAD_WORKERS = 4
 
+
+@dataclass(frozen=True)
 class FineTuner(BaseAction):
+    # Whether the user can be asked questions. When running without any menus, the default answer is used instead.
+    interactive: bool = True
+
     @staticmethod
     def dedent_print(text: str) -> None:
         rich_print(dedent(text).lstrip())
@@ -58,17 +69,12 @@ class FineTuner(BaseAction):
         if config.job_id:
             return self.poll_job_status()
 
-        with progress_open(config.training_data_file, "rb", description=f"Uploading [purple]{config.training_data_file}[/]...") as fp:
-            file = self.openai.files.create(
-                file=fp,
-                purpose="fine-tune",
-            )
-        rich_print()
+        file_id = self.upload_training_data()
 
         try:
             job = self.openai.fine_tuning.jobs.create(
                 model=config.base_model,
-                training_file=file.id,
+                training_file=file_id,
             )
         except BadRequestError as e:
             e.add_note("[italic]Hint: Try changing the base model value in the config...")
@@ -77,6 +83,87 @@ class FineTuner(BaseAction):
         config.job_id = job.id
         return job
 
+    def upload_training_data(self) -> str:
+        # Uploaded files are tracked by a hash of their contents, so the same training data is never uploaded twice.
+        with config.training_data_file.open("rb") as fp:
+            file_hash = file_digest(fp, "sha256").hexdigest()
+
+        if file_id := config.uploaded_files.get(file_hash):
+            try:
+                file = self.openai.files.retrieve(file_id)
+            except NotFoundError:
+                pass
+            else:
+                if file.status != "error":
+                    rich_print(f"[gray62]Reusing previously uploaded training data: {file_id}\n")
+                    return file_id
+
+            self.forget_uploaded_file(file_id)
+
+        if config.training_data_file.stat().st_size > UPLOAD_PART_SIZE:
+            file_id = self.upload_parts(file_hash)
+        else:
+            with progress_open(config.training_data_file, "rb", description=f"Uploading [purple]{config.training_data_file}[/]...") as fp:
+                file_id = self.openai.files.create(
+                    file=fp,
+                    purpose="fine-tune",
+                ).id
+        rich_print()
+
+        config.uploaded_files = {**config.uploaded_files, file_hash: file_id}
+        return file_id
+
+    def upload_parts(self, file_hash: str) -> str:
+        size = config.training_data_file.stat().st_size
+        part_count = ceil(size / UPLOAD_PART_SIZE)
+
+        # Parts that were uploaded before being interrupted are kept, as long as the training data has not changed since.
+        if not (config.upload_id and config.upload_hash == file_hash and len(config.upload_part_ids) == part_count):
+            upload = self.openai.uploads.create(
+                bytes=size,
+                filename=config.training_data_file.name,
+                mime_type="application/jsonl",
+                purpose="fine-tune",
+            )
+            config.upload_id = upload.id
+            config.upload_hash = file_hash
+            config.upload_part_ids = [""] * part_count
+
+        part_ids = list(config.upload_part_ids)
+        try:
+            with PreviewLive() as live, ThreadPoolExecutor(UPLOAD_WORKERS) as executor:
+                task_id = live.progress.add_task(f"Uploading [purple]{config.training_data_file}[/] in parts...", total=part_count, completed=part_count - part_ids.count(""))
+                futures = {executor.submit(self.upload_part, config.upload_id, index): index for index, part_id in enumerate(part_ids) if not part_id}
+                for future in as_completed(futures):
+                    part_ids[futures[future]] = future.result()
+                    config.upload_part_ids = part_ids
+                    live.progress.advance(task_id)
+
+            upload = self.openai.uploads.complete(config.upload_id, part_ids=part_ids)
+        except (BadRequestError, NotFoundError) as e:
+            # Uploads expire after an hour, so there is nothing left to resume.
+            config.upload_id = ""
+            e.add_note("[italic]Hint: Try fine-tuning again to restart the upload...")
+            raise
+
+        config.upload_id = ""
+        config.upload_hash = ""
+        config.upload_part_ids = []
+
+        if upload.file is None:
+            msg = "Upload completed without creating a file! [italic]Hint: Try fine-tuning again..."
+            raise TumblrBotError(msg)
+        return upload.file.id
+
+    def upload_part(self, upload_id: str, index: int) -> str:
+        with config.training_data_file.open("rb") as fp:
+            fp.seek(index * UPLOAD_PART_SIZE)
+            data = fp.read(UPLOAD_PART_SIZE)
+        return self.openai.uploads.parts.create(upload_id, data=data).id
+
+    def forget_uploaded_file(self, file_id: str) -> None:
+        config.uploaded_files = {file_hash: uploaded_file_id for file_hash, uploaded_file_id in config.uploaded_files.items() if uploaded_file_id != file_id}
+
     def poll_job_status(self) -> FineTuningJob:
         job = self.openai.fine_tuning.jobs.retrieve(config.job_id)
 
@@ -101,8 +188,9 @@ class FineTuner(BaseAction):
         config.job_id = ""
 
         if job.status != "succeeded":
-            if Confirm.ask("[gray62]Delete uploaded examples file?", default=False):
+            if self.interactive and Confirm.ask("[gray62]Delete uploaded examples file?", default=False):
                 self.openai.files.delete(job.training_file)
+                self.forget_uploaded_file(job.training_file)
                 rich_print()
 
             if job.error is None:
@@ -130,20 +218,11 @@ class FineTuner(BaseAction):
         """)
 
     def count_tokens(self) -> Generator[int]:
-        # Based on https://cookbook.openai.com/examples/how_to_count_tokens_with_tiktoken
-        # and https://cookbook.openai.com/examples/chat_finetuning_data_prep
-        try:
-            encoding = encoding_for_model(config.base_model)
-        except KeyError as error:
-            encoding = get_encoding("o200k_base")
-            warning_console.print(f"Using encoding '{encoding.name}': {''.join(error.args)}\n")
+        encoding = get_token_encoding()
 
         with config.training_data_file.open(encoding="utf_8") as fp:
             for line in fp:
-                example = Example.model_validate_json(line)
-                yield len(encoding.encode("assistant"))  # every reply is primed with <|start|>assistant<|message|>
-                for message in example.messages:
-                    yield 4 + len(encoding.encode(message.content))
+                yield Example.model_validate_json(line).count_tokens(encoding)
 
     def get_cost_string(self, total_tokens: int) -> str:
         usd_cost = config.token_price / 1000000 * total_tokens
@@ -1,42 +1,161 @@
-from dataclasses import dataclass
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from functools import cache
-from random import choice, random, sample
+from math import ceil
+from queue import Queue
+from random import choice, random, randrange
+from threading import Event
+from time import perf_counter
 from typing import TYPE_CHECKING, override
 
 from openai import BadRequestError
+from pydantic import ValidationError
+from requests import HTTPError
 from rich import print as rich_print
 
 from tumblrbot.actions.base import BaseAction
-from tumblrbot.utils.common import PreviewLive, config, localize_number
-from tumblrbot.utils.models import Block, Post
+from tumblrbot.utils.common import PreviewLive, config, localize_number, random_permutation, warning_console
+from tumblrbot.utils.models import Block, GeneratedPost, Post, SpooledDraft
+from tumblrbot.utils.spool import DraftSpool
+from tumblrbot.utils.tumblr import POSTS_PER_PAGE, rate_limit_retry
 
 if TYPE_CHECKING:
-    from collections.abc import Iterable
+    from collections.abc import Iterator
+
+    from rich.progress import TaskID
+
+
+@dataclass
+class GenerationStats:
+    # The number of OpenAI requests and the total seconds spent on them, by the kind of request.
+    requests: Counter[str] = field(default_factory=Counter[str])
+    seconds: Counter[str] = field(default_factory=Counter[str])
+
+    def record(self, kind: str, start: float) -> None:
+        self.requests[kind] += 1
+        self.seconds[kind] += perf_counter() - start
+
+    def get_average(self, kind: str) -> float:
+        return self.seconds[kind] / self.requests[kind] if self.requests[kind] else 0
+
+    def get_summary(self) -> str | None:
+        combined = self.requests["combined"]
+        if not combined and not self.requests["unparsed"]:
+            return None
+
+        summary = f"Generated text and tags together for {localize_number(combined)} draft(s), saving {localize_number(combined)} request(s)"
+        # Separate tag requests are estimated to take as long as text requests if there were none this run.
+        # Unparsed responses saved no requests, since the text was generated again, but they cost their own time and skipped a tag request.
+        if text_average := self.get_average("text"):
+            tags_average = self.get_average("tags") or text_average
+            saved_seconds = combined * (text_average + tags_average - self.get_average("combined")) + self.requests["unparsed"] * tags_average - self.seconds["unparsed"]
+            summary += f" and ~{saved_seconds:.1f} second(s)"
+        if unparsed := self.requests["unparsed"]:
+            summary += f". {localize_number(unparsed)} response(s) could not be read, so those drafts were generated again without tags"
+        return f"{summary}."
 
 
 @dataclass(frozen=True)
 class DraftGenerator(BaseAction):
     @override
     def main(self) -> None:
-        message = f"View drafts here: https://tumblr.com/blog/{config.upload_blog_identifier}/drafts"
+        # Actions are reused between runs when running on a schedule or from the menu, and blogs being reblogged from may have new posts since the last run.
+        self.clear_reblog_caches()
+
+        # Drafts are generated in the background and written to the spool as fast as OpenAI allows.
+        # Uploading drains the spool at whatever pace Tumblr allows, so waiting for a rate limit never holds up or risks losing generated drafts.
+        spool, drafts = self.open_spool()
+        stop_event = Event()
+        stats = GenerationStats()
+
+        with PreviewLive() as live, ThreadPoolExecutor(1) as executor:
+            generate_task_id = live.progress.add_task("Generating drafts...", total=config.draft_count)
+            upload_task_id = live.progress.add_task("Uploading drafts...", total=drafts.qsize() + config.draft_count)
+
+            future = executor.submit(self.generate_drafts, spool, drafts, stop_event, stats, live, generate_task_id)
+            try:
+                self.upload_drafts(spool, drafts, live, upload_task_id)
+            except BaseException:
+                stop_event.set()
+                raise
+            future.result()
+
+        rich_print(f":chart_increasing: [bold green]Generated {localize_number(config.draft_count)} draft(s).[/] {self.get_drafts_message()}")
+        if summary := stats.get_summary():
+            rich_print(f"[gray62]{summary}")
+
+    def upload(self) -> None:
+        spool, drafts = self.open_spool()
+        drafts.put(None)
 
         with PreviewLive() as live:
-            for i in live.progress.track(range(config.draft_count), description="Generating drafts..."):
-                try:
-                    post = self.generate_post()
-                    self.tumblr.create_post(config.upload_blog_identifier, post)
-                    live.custom_update(post)
-                except BadRequestError as e:
-                    e.add_note("[italic]Hint: Try fine-tuning a model or changing the fine-tuned model value in the config...")
-                    raise
-                except BaseException as e:
-                    if i > 0:
-                        e.add_note(f"📉 An error occurred! Generated {localize_number(i)} draft(s) before failing. {message}")
-                    raise
-
-        rich_print(f":chart_increasing: [bold green]Generated {localize_number(config.draft_count)} draft(s).[/] {message}")
-
-    def generate_post(self) -> Post:
+            task_id = live.progress.add_task("Uploading drafts...", total=drafts.qsize() - 1)
+            self.upload_drafts(spool, drafts, live, task_id)
+
+        rich_print(f":chart_increasing: [bold green]Uploaded all generated drafts.[/] {self.get_drafts_message()}")
+
+    def open_spool(self) -> tuple[DraftSpool, Queue[SpooledDraft | None]]:
+        spool = DraftSpool(config.draft_spool_file)
+        if unconfirmed := spool.resolve_unconfirmed():
+            warning_console.print(
+                f"{localize_number(len(unconfirmed))} draft(s) were being uploaded when the program was closed and will not be uploaded again, in case they already were. {self.get_drafts_message()}",
+            )
+
+        drafts = Queue[SpooledDraft | None]()
+        for draft in spool.get_pending():
+            drafts.put(draft)
+        return spool, drafts
+
+    def get_drafts_message(self) -> str:
+        return f"View drafts here: https://tumblr.com/blog/{config.upload_blog_identifier}/drafts"
+
+    def generate_drafts(self, spool: DraftSpool, drafts: Queue[SpooledDraft | None], stop_event: Event, stats: GenerationStats, live: PreviewLive, task_id: TaskID) -> None:
+        try:
+            for _ in range(config.draft_count):
+                if stop_event.is_set():
+                    return
+
+                drafts.put(spool.append(self.generate_post(stats)))
+                live.progress.advance(task_id)
+        except BadRequestError as e:
+            e.add_note("[italic]Hint: Try fine-tuning a model or changing the fine-tuned model value in the config...")
+            raise
+        finally:
+            drafts.put(None)
+
+    def upload_drafts(self, spool: DraftSpool, drafts: Queue[SpooledDraft | None], live: PreviewLive, task_id: TaskID) -> None:
+        uploaded = 0
+        try:
+            while (draft := drafts.get()) is not None:
+                self.upload_draft(spool, draft)
+                live.custom_update(draft.post)
+                live.progress.advance(task_id)
+                uploaded += 1
+        except BaseException as e:
+            message = (
+                f"Uploaded {localize_number(uploaded)} draft(s) before failing. "
+                "Generated drafts are kept and will be uploaded on the next run, unless a draft's upload was cut off before Tumblr answered, in case it was already uploaded."
+            )
+            e.add_note(f"📉 An error occurred! {message} {self.get_drafts_message()}")
+            raise
+
+        spool.clear_if_done()
+
+    @rate_limit_retry
+    def upload_draft(self, spool: DraftSpool, draft: SpooledDraft) -> None:
+        # Each attempt is marked right before it is sent, so a draft is never uploaded twice if the program is closed before Tumblr answers.
+        spool.mark(draft, "uploading")
+        try:
+            self.tumblr.send_post(config.upload_blog_identifier, draft.post)
+        except HTTPError as e:
+            # Tumblr answered with an error, including rate limits, so the draft was not uploaded and can be safely uploaded again.
+            if e.response is not None:
+                spool.mark(draft, "failed")
+            raise
+        spool.mark(draft, "uploaded")
+
+    def generate_post(self, stats: GenerationStats) -> Post:
         if original := self.get_random_post():
             user_message = config.reblog_user_message.format(original)
             if "{}" not in config.reblog_user_message:
@@ -44,14 +163,32 @@ class DraftGenerator(BaseAction):
         else:
             original = Post()
             user_message = config.user_message
-        text = self.generate_text(user_message)
 
-        if tags := self.generate_tags(text):
-            tags = tags.tags
+        # Tags are rolled before generating, so the chance is the same whether or not they are generated along with the text.
+        should_generate_tags = random() < config.tags_chance  # noqa: S311
+        generated = None
+        if should_generate_tags and config.combined_tags:
+            start = perf_counter()
+            generated = self.generate_text_and_tags(user_message)
+            stats.record("combined" if generated is not None else "unparsed", start)
+
+        if generated is not None:
+            text, tags = generated.text, generated.tags
+        else:
+            start = perf_counter()
+            text = self.generate_text(user_message)
+            stats.record("text", start)
+
+            # If the combined response could not be read, the draft is left without tags instead of making a third request.
+            tags = []
+            if should_generate_tags and not config.combined_tags:
+                start = perf_counter()
+                tags = self.generate_tags(text)
+                stats.record("tags", start)
 
         return Post(
             content=[Block(text=text)],
-            tags=tags or [],
+            tags=tags,
             parent_tumblelog_uuid=original.blog.uuid,
             parent_post_id=original.id,
             reblog_key=original.reblog_key,
@@ -64,36 +201,66 @@ class DraftGenerator(BaseAction):
             model=config.fine_tuned_model,
         ).output_text
 
-    def generate_tags(self, text: str) -> Post | None:
-        if random() < config.tags_chance:  # noqa: S311
-            return self.openai.responses.parse(
-                text_format=Post,
-                input=text,
-                instructions=config.tags_developer_message,
-                model=config.base_model,
-            ).output_parsed
+    def generate_tags(self, text: str) -> list[str]:
+        post = self.openai.responses.parse(
+            text_format=Post,
+            input=text,
+            instructions=config.tags_developer_message,
+            model=config.base_model,
+        ).output_parsed
 
-        return None
+        return [] if post is None else post.tags
+
+    def generate_text_and_tags(self, user_message: str) -> GeneratedPost | None:
+        # Returns None if the response could not be read, such as when it is a refusal, is cut off, or is not valid JSON.
+        try:
+            response = self.openai.responses.parse(
+                text_format=GeneratedPost,
+                input=user_message,
+                instructions=f"{config.developer_message}\n\n{config.combined_tags_developer_message}",
+                model=config.fine_tuned_model,
+            )
+        except ValidationError:
+            return None
+
+        return response.output_parsed if response.status == "completed" else None
 
     def get_random_post(self) -> Post | None:
         if config.reblog_blog_identifiers and random() < config.reblog_chance:  # noqa: S311
             blog_identifier = choice(config.reblog_blog_identifiers)  # noqa: S311
-            for offset in self.get_offsets(blog_identifier):
-                for raw_post in self.tumblr.retrieve_published_posts(
-                    blog_identifier,
-                    offset,
-                ).response.posts:
-                    post = Post.model_validate(raw_post)
-                    if post.valid_text_post() and self.is_trail_valid(post.trail):
-                        return post
+            # Valid posts from each page are kept until they are used, so every post can be reblogged without requesting its page again.
+            posts = self.get_unused_posts(blog_identifier)
+            offsets = self.get_offsets(blog_identifier)
+            while not posts and (offset := next(offsets, None)) is not None:
+                posts.extend(
+                    post
+                    for raw_post in self.tumblr.retrieve_published_posts(
+                        blog_identifier,
+                        offset,
+                    ).response.posts
+                    if (post := Post.model_validate(raw_post)).valid_text_post() and self.is_trail_valid(post.trail)
+                )
+
+            if posts:
+                return posts.pop(randrange(len(posts)))  # noqa: S311
 
         return None
 
-    @cache  # noqa: B019 # This creates a memory leak, but it doesn't matter since this class isn't discarded until the end of the program anyways.
-    def get_offsets(self, blog_identifier: str) -> Iterable[int]:
+    @classmethod
+    def clear_reblog_caches(cls) -> None:
+        cls.get_unused_posts.cache_clear()
+        cls.get_offsets.cache_clear()
+
+    @cache  # noqa: B019 # The same list is cached, so posts removed from it are never used twice. This is cleared before every run.
+    def get_unused_posts(self, _blog_identifier: str) -> list[Post]:
+        return []
+
+    @cache  # noqa: B019 # This class isn't discarded until the end of the program, and this is cleared before every run.
+    def get_offsets(self, blog_identifier: str) -> Iterator[int]:
         total = self.tumblr.retrieve_blog_info(blog_identifier).response.blog.posts
-        # The same Iterable object is cached, so reading an element will effectively discard it. This prevents checking the same offsets twice.
-        return iter(sample(range(total), total))
+        # Every request returns a whole page of posts, so offsets are sampled a page at a time.
+        # The same Iterator object is cached, so reading an element will effectively discard it. This prevents checking the same pages twice.
+        return (page * POSTS_PER_PAGE for page in random_permutation(ceil(total / POSTS_PER_PAGE)))
 
     def is_trail_valid(self, trail: list[Post]) -> bool:
         # Checks if every post in the reblog trail is valid and that the blog that created the post is in the allowed reblog list.
@@ -0,0 +1,131 @@
+from compression import gzip, zstd
+from compression.zlib import MAX_WBITS, decompressobj
+from itertools import batched
+from typing import TYPE_CHECKING, Literal
+
+from tumblrbot.utils.common import TumblrBotError
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Generator, Iterable
+    from pathlib import Path
+
+Compression = Literal["none", "gzip", "zstd"]
+
+SUFFIXES: dict[Compression, str] = {
+    "none": ".jsonl",
+    "gzip": ".jsonl.gz",
+    "zstd": ".jsonl.zst",
+}
+CHUNK_SIZE = 1024 * 1024
+REWRITE_BATCH_SIZE = 1000
+
+# Post data is stored as JSON Lines, optionally compressed.
+# Compressed files are a series of independent gzip members or zstd frames, one per appended batch of lines.
+# Appending never has to touch existing data, and a crash can only ever leave the last frame incomplete, which is discarded when read.
+
+
+def get_compression(path: Path) -> Compression:
+    for compression, suffix in SUFFIXES.items():
+        if compression != "none" and path.name.endswith(suffix):
+            return compression
+    return "none"
+
+
+def compress(data: bytes, compression: Compression) -> bytes:
+    match compression:
+        case "gzip":
+            return gzip.compress(data, compresslevel=6)
+        case "zstd":
+            return zstd.compress(data)
+        case "none":
+            return data
+
+
+def read_frames(path: Path, compression: Compression | None = None) -> Generator[tuple[int, bytes]]:
+    # Yields the decompressed contents of every complete frame along with the file offset where that frame ends.
+    # The compression is taken from the file name unless it is given.
+    if compression is None:
+        compression = get_compression(path)
+
+    with path.open("rb") as fp:
+        if compression == "none":
+            # For uncompressed files, every complete line is its own frame.
+            offset = 0
+            for line in fp:
+                if not line.endswith(b"\n"):
+                    return
+                offset += len(line)
+                yield offset, line
+            return
+
+        decompressor = zstd.ZstdDecompressor() if compression == "zstd" else decompressobj(MAX_WBITS | 16)
+        output = bytearray()
+        position = 0
+        while chunk := fp.read(CHUNK_SIZE):
+            position += len(chunk)
+            while chunk:
+                output += decompressor.decompress(chunk)
+                if not decompressor.eof:
+                    break
+
+                chunk = decompressor.unused_data
+                yield position - len(chunk), bytes(output)
+
+                output.clear()
+                decompressor = zstd.ZstdDecompressor() if compression == "zstd" else decompressobj(MAX_WBITS | 16)
+
+
+def read_lines(path: Path) -> Generator[bytes]:
+    for _, data in read_frames(path):
+        yield from data.splitlines()
+
+
+def repair_archive(path: Path) -> tuple[int, bytes | None]:
+    # Returns the number of lines and the last line in the file, after discarding any incomplete frame left behind by a crash.
+    end = 0
+    line_count = 0
+    last_line = None
+    for end, data in read_frames(path):
+        lines = data.splitlines()
+        line_count += len(lines)
+        if lines:
+            last_line = lines[-1]
+
+    if path.stat().st_size > end:
+        with path.open("r+b") as fp:
+            fp.truncate(end)
+
+    return line_count, last_line
+
+
+def append_archive(path: Path, lines: Iterable[bytes], compression: Compression | None = None) -> int:
+    # Returns the number of lines appended. The compression is taken from the file name unless it is given.
+    lines = [line + b"\n" for line in lines]
+    if lines:
+        with path.open("ab") as fp:
+            fp.write(compress(b"".join(lines), get_compression(path) if compression is None else compression))
+    return len(lines)
+
+
+def rewrite_archive(source: Path, destination: Path, transform: Callable[[bytes], bytes] | None = None) -> None:
+    # Writes to a temporary file first, so the destination is never left partially written.
+    # The source and destination can be the same file.
+    # The temporary file is read back before replacing the destination, so the source can be safely removed afterwards.
+    compression = get_compression(destination)
+    temporary_path = destination.with_name(f"{destination.name}.tmp")
+    temporary_path.unlink(missing_ok=True)
+    temporary_path.touch()
+
+    lines = read_lines(source)
+    line_count = sum(append_archive(temporary_path, batch, compression) for batch in batched(lines if transform is None else map(transform, lines), REWRITE_BATCH_SIZE, strict=False))
+
+    written_line_count = 0
+    end = 0
+    for end, data in read_frames(temporary_path, compression):
+        written_line_count += len(data.splitlines())
+    if written_line_count != line_count or end != temporary_path.stat().st_size:
+        temporary_path.unlink()
+        msg = f"Failed to rewrite '{source}' to '{destination}'! Wrote {line_count} lines, but only {written_line_count} could be read back."
+        raise TumblrBotError(msg)
+
+    temporary_path.replace(destination)
@@ -1,23 +1,29 @@
 from locale import localize
-from random import choice
-from typing import TYPE_CHECKING
+from random import choice, getrandbits
+from typing import TYPE_CHECKING, override
 
 from rich._spinners import SPINNERS
 from rich.console import Console
 from rich.live import Live
 from rich.progress import MofNCompleteColumn, Progress, SpinnerColumn, TimeElapsedColumn
 from rich.table import Table
+from tiktoken import encoding_for_model, get_encoding
 
 from tumblrbot.utils.models import Config
 
 if TYPE_CHECKING:
+    from collections.abc import Generator
+
     from rich.console import RenderableType
+    from tiktoken import Encoding
+
+
+PERMUTATION_ROUNDS = 4
+UINT64_MASK = 0xFFFFFFFFFFFFFFFF
 
 
 class PreviewLive(Live):
     def __init__(self) -> None:
-        super().__init__()
-
         spinner_name = choice(list(SPINNERS))  # noqa: S311
         self.progress = Progress(
             *Progress.get_default_columns(),
@@ -27,13 +33,22 @@ class PreviewLive(Live):
             auto_refresh=False,
         )
 
-        self.custom_update()
+        self.renderables: tuple[RenderableType | None, ...] = ()
+
+        # The display is only built when it is refreshed, at most refresh_per_second times.
+        # Updates in between only replace what will be shown next, so they cost almost nothing.
+        super().__init__(refresh_per_second=config.preview_refresh_rate)
 
     def custom_update(self, *renderables: RenderableType | None) -> None:
+        if config.show_previews:
+            self.renderables = renderables
+
+    @override
+    def get_renderable(self) -> RenderableType:
         table = Table.grid()
         table.add_row(self.progress)
-        table.add_row(*renderables)
-        self.update(table)
+        table.add_row(*self.renderables)
+        return table
 
 
 class TumblrBotError(Exception):
@@ -44,6 +59,38 @@ def localize_number(value: object) -> str:
     return localize(str(value), grouping=True)
 
 
+def mix_bits(value: int) -> int:
+    # Scrambles a 64-bit number so that every bit of the result depends on every bit of the input, the same way as SplitMix64.
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & UINT64_MASK
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & UINT64_MASK
+    return value ^ (value >> 31)
+
+
+def random_permutation(length: int) -> Generator[int]:
+    # Yields every number in range(length) exactly once in a random order, using constant memory.
+    # This shuffles every number below the next power of four with a small Feistel network using random round keys.
+    # A Feistel network always maps each number to a different number, so skipping the results that are out of range leaves a permutation.
+    half_bits = max(1, ((length - 1).bit_length() + 1) // 2)
+    half_mask = (1 << half_bits) - 1
+    round_keys = [getrandbits(64) for _ in range(PERMUTATION_ROUNDS)]  # noqa: S311
+
+    for value in range(1 << (2 * half_bits)):
+        left, right = value >> half_bits, value & half_mask
+        for round_key in round_keys:
+            left, right = right, left ^ (mix_bits(right ^ round_key) & half_mask)
+        if (result := (left << half_bits) | right) < length:
+            yield result
+
+
+def get_token_encoding() -> Encoding:
+    try:
+        return encoding_for_model(config.base_model)
+    except KeyError as error:
+        encoding = get_encoding("o200k_base")
+        warning_console.print(f"Using encoding '{encoding.name}': {''.join(error.args)}\n")
+        return encoding
+
+
 config = Config.load()
 
 console = Console()
@@ -0,0 +1,111 @@
+from collections import Counter, deque
+from re import IGNORECASE
+from re import compile as re_compile
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Hashable, Iterable, Sequence
+
+REGEX_CHARACTERS = frozenset(".^$*+?{}[]|()")
+
+
+def parse_literal(word: str) -> str | None:
+    # Returns the text that a filtered word matches if it is a plain word, or None if it is a regular expression.
+    # Escaped characters like "\." are plain, but escape sequences like "\b" are not.
+    characters: list[str] = []
+    escaped = False
+    for character in word:
+        if escaped:
+            if character.isalnum():
+                return None
+            characters.append(character)
+            escaped = False
+        elif character == "\\":
+            escaped = True
+        elif character in REGEX_CHARACTERS:
+            return None
+        else:
+            characters.append(character)
+
+    return None if escaped else "".join(characters)
+
+
+class AhoCorasick:
+    # Finds any of a set of words in a single pass over the text, no matter how many words there are.
+    def __init__(self, words: Iterable[Sequence[Hashable]]) -> None:
+        self.transitions: list[dict[Hashable, int]] = [{}]
+        self.fails = [0]
+        # The index of a word that ends at each state, including words that end at any of its fail states.
+        self.outputs: list[int | None] = [None]
+
+        for index, word in enumerate(words):
+            state = 0
+            for symbol in word:
+                if symbol not in self.transitions[state]:
+                    self.transitions[state][symbol] = len(self.transitions)
+                    self.transitions.append({})
+                    self.fails.append(0)
+                    self.outputs.append(None)
+                state = self.transitions[state][symbol]
+
+            if self.outputs[state] is None:
+                self.outputs[state] = index
+
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for symbol, next_state in self.transitions[state].items():
+                queue.append(next_state)
+
+                fail = self.fails[state]
+                while fail and symbol not in self.transitions[fail]:
+                    fail = self.fails[fail]
+                self.fails[next_state] = self.transitions[fail].get(symbol, 0)
+
+                if self.outputs[next_state] is None:
+                    self.outputs[next_state] = self.outputs[self.fails[next_state]]
+
+    def search(self, text: Iterable[Hashable]) -> int | None:
+        # Returns the index of the first word found in the text.
+        transitions = self.transitions
+        fails = self.fails
+        outputs = self.outputs
+
+        state = 0
+        if outputs[state] is not None:
+            return outputs[state]
+
+        for symbol in text:
+            while state and symbol not in transitions[state]:
+                state = fails[state]
+            state = transitions[state].get(symbol, 0)
+
+            if outputs[state] is not None:
+                return outputs[state]
+
+        return None
+
+
+class WordFilter:
+    def __init__(self, words: Iterable[str]) -> None:
+        self.words = list(words)
+        self.matches = Counter[str]()
+
+        literals = {index: literal.lower() for index, word in enumerate(self.words) if (literal := parse_literal(word)) is not None}
+        self.literal_indices = list(literals)
+        self.automaton = AhoCorasick(literals.values())
+        self.patterns = [(word, re_compile(word, IGNORECASE)) for index, word in enumerate(self.words) if index not in literals]
+
+    def __bool__(self) -> bool:
+        return bool(self.words)
+
+    def search(self, text: str) -> str | None:
+        # Returns the filtered word that matched the text and records it.
+        if (index := self.automaton.search(text.lower())) is not None:
+            match = self.words[self.literal_indices[index]]
+        else:
+            match = next((word for word, pattern in self.patterns if pattern.search(text)), None)
+
+        if match is not None:
+            self.matches[match] += 1
+        return match
@@ -5,7 +5,7 @@ from tomllib import loads
 from typing import TYPE_CHECKING, Annotated, Any, Literal, Self, override
 
 from openai.types import ResponsesModel  # noqa: TC002
-from pydantic import BaseModel, ConfigDict, Field, NonNegativeFloat, NonNegativeInt, PlainSerializer, PositiveFloat, PositiveInt, model_validator
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, NonNegativeFloat, NonNegativeInt, PlainSerializer, PositiveFloat, PositiveInt, model_validator
 from pydantic.json_schema import SkipJsonSchema  # noqa: TC002
 from questionary import Choice, checkbox, select
 from requests_oauthlib import OAuth1Session
@@ -17,6 +17,8 @@ from tomlkit import comment, document, dumps  # pyright: ignore[reportUnknownVar
 if TYPE_CHECKING:
     from collections.abc import Generator
 
+    from tiktoken import Encoding
+
 
 class FullyValidatedModel(BaseModel):
     model_config = ConfigDict(
@@ -56,9 +58,18 @@ class FileSyncSettings(FullyValidatedModel):
 
 
 class Config(FileSyncSettings):
+    # General
+    profile_actions: bool = Field(False, description="Whether to profile the CPU and memory usage of every action. This can also be turned on by setting the TUMBLRBOT_PROFILE environment variable to 1.")
+    profiles_directory: Path = Field(Path("profiles"), description="Where to store profiles of actions.")
+    schedule_interval: NonNegativeFloat = Field(86400, description="The number of seconds to wait between scheduled runs of actions.")
+    schedule_jitter: NonNegativeFloat = Field(600, description="The maximum number of seconds randomly added to or removed from the wait between scheduled runs.")
+
     # Downloading Posts & Writing Examples
     download_blog_identifiers: list[str] = Field([], description="The identifiers of the blogs which post data will be downloaded from.")
     data_directory: Path = Field(Path("data"), description="Where to store downloaded post data.")
+    data_compression: Literal["none", "gzip", "zstd"] = Field("none", description="How to compress downloaded post data. Existing data can be converted with the migrate action.")
+    download_shards: PositiveInt = Field(1, description="The number of time windows to split a blog into when downloading it for the first time. Each window is downloaded in parallel. Set to 1 to download blogs one page at a time.")
+    project_post_data: bool = Field(False, description="Whether to only store the parts of downloaded posts that are used by this program. This makes downloaded post data much smaller, but everything else is discarded.")
 
     # Writing Examples
     date_limit: datetime = Field(datetime.fromtimestamp(0, UTC), description="How old a post can be and still be included in training data.")
@@ -66,6 +77,9 @@ class Config(FileSyncSettings):
     moderation_batch_size: PositiveInt = Field(25, description="The number of posts at a time to submit to the OpenAI moderation API.")
     custom_prompts_file: Path = Field(Path("custom_prompts.jsonl"), description="Where to read in custom prompts from.")
     filtered_words: list[str] = Field([], description="A case-insensitive list of disallowed words used to filter out training data. Regular expressions are allowed, but must be escaped.")
+    token_budget: NonNegativeInt = Field(0, description="The maximum number of tokens per epoch in the training data. Set to 0 for no limit.")
+    cost_budget: NonNegativeFloat = Field(0, description="The maximum expected cost in USD of fine-tuning with the training data, based on the token price and expected epochs. Set to 0 for no limit.")
+    budget_priority: Literal["recency", "balanced"] = Field("recency", description="Which posts to keep when the training data is over budget. 'recency' keeps the newest posts overall. 'balanced' keeps the newest posts from each blog in equal numbers.")
 
     # Writing Examples & Fine-Tuning
     training_data_file: Path = Field(Path("training_data.jsonl"), description="Where to output the training data that will be used to fine-tune the model.")
@@ -78,16 +92,27 @@ class Config(FileSyncSettings):
     expected_epochs: PositiveInt = Field(3, description="The expected number of epochs fine-tuning will be run for. This will be updated during fine-tuning.")
     token_price: PositiveFloat = Field(3, description="The expected price in USD per million tokens during fine-tuning for the current model.")
     job_id: str = Field("", description="The fine-tuning job ID that will be polled on next run.")
+    uploaded_files: dict[str, str] = Field({}, description="The IDs of training data files uploaded to OpenAI, by the SHA-256 hash of their contents. These are reused instead of uploading the same training data again.")
+    upload_id: str = Field("", description="The ID of an unfinished upload of large training data that will be resumed on next run.")
+    upload_hash: str = Field("", description="The SHA-256 hash of the training data being uploaded in parts.")
+    upload_part_ids: list[str] = Field([], description="The IDs of the parts of the unfinished upload that have already been uploaded, in order. Parts that have not been uploaded are empty.")
 
     # Fine-Tuning & Generating
     base_model: ResponsesModel = Field("gpt-4o-mini-2024-07-18", description="The name of the model that will be fine-tuned by the generated training data.")
     fine_tuned_model: str = Field("", description="The name of the OpenAI model that was fine-tuned with your posts.")
 
+    # Downloading Posts & Generating
+    show_previews: bool = Field(True, description="Whether to show previews of posts while downloading and generating. Turning this off reduces CPU usage for large batches.")
+    preview_refresh_rate: PositiveFloat = Field(4, description="The maximum number of times per second that progress and previews are redrawn.")
+
     # Generating
     upload_blog_identifier: str = Field("", description="The identifier of the blog which generated drafts will be uploaded to. This must be a blog associated with the same account as the configured Tumblr secret tokens.")
     draft_count: PositiveInt = Field(100, description="The number of drafts to process. This will affect the number of tokens used with OpenAI")
+    draft_spool_file: Path = Field(Path("draft_spool.jsonl"), description="Where to store generated drafts until they are uploaded.")
     tags_chance: NonNegativeFloat = Field(0.1, description="The chance to generate tags for any given post. This will use more OpenAI tokens.")
     tags_developer_message: str = Field("You will be provided with a block of text, and your task is to extract a very short list of the most important subjects from it.", description="The developer message used to generate tags.")
+    combined_tags: bool = Field(False, description="Whether to generate tags together with the post text in one request to the fine-tuned model, instead of a separate request to the base model. This is faster and uses fewer requests, but the tags may be worse.")
+    combined_tags_developer_message: str = Field("Also provide a very short list of the most important subjects of your post as its tags.", description="The developer message added when generating tags together with the post text.")
     reblog_blog_identifiers: list[str] = Field([], description="The identifiers of blogs that can be reblogged from when generating drafts.")
     reblog_chance: NonNegativeFloat = Field(0.1, description="The chance to generate a reblog of a random post. This will use more OpenAI tokens.")
     reblog_user_message: str = Field("Please write a comical Tumblr post in response to the following post:\n\n{}", description="The format string for the user message used to reblog posts.")
@@ -169,6 +194,7 @@ class Blog(FullyValidatedModel):
     name: str = ""
     description: str = ""
     posts: int = 0
+    updated: int = 0
     uuid: str = ""
 
 
@@ -199,7 +225,8 @@ class Post(FullyValidatedModel):
     reblog_key: str = ""
 
     timestamp: int = 0
-    tags: Annotated[list[str], PlainSerializer(",".join)] = []
+    # Tags are sent to Tumblr as a comma-separated string, so they are also read back from one.
+    tags: Annotated[list[str], PlainSerializer(",".join), BeforeValidator(lambda tags: [tag for tag in tags.split(",") if tag] if isinstance(tags, str) else tags)] = []
     state: Literal["published", "queued", "draft", "private", "unapproved"] = "draft"
 
     content: list[Block] = []
@@ -208,6 +235,19 @@ class Post(FullyValidatedModel):
 
     is_submission: SkipJsonSchema[bool] = False
 
+    @classmethod
+    def project(cls, data: dict[str, Any]) -> dict[str, Any]:
+        # Removes everything from raw post data that is not read by this model, including in the blog, blocks, and reblog trail.
+        projected = {name: value for name, value in data.items() if name in cls.model_fields}
+        if "blog" in projected:
+            projected["blog"] = {name: value for name, value in projected["blog"].items() if name in Blog.model_fields}
+        for name in ("content", "layout"):
+            if name in projected:
+                projected[name] = [{key: value for key, value in block.items() if key in Block.model_fields} for block in projected[name]]
+        if "trail" in projected:
+            projected["trail"] = list(map(cls.project, projected["trail"]))
+        return projected
+
     def __rich__(self) -> Panel:
         return Panel(
             str(self),
@@ -230,6 +270,16 @@ class Post(FullyValidatedModel):
         return bool(self.content) and all(block.type == "text" for block in self.content) and not (self.is_submission or any(block.type == "ask" for block in self.layout))
 
 
+class GeneratedPost(FullyValidatedModel):
+    text: str
+    tags: list[str]
+
+
+class SpooledDraft(FullyValidatedModel):
+    id: int
+    post: Post
+
+
 class Message(FullyValidatedModel):
     role: Literal["developer", "user", "assistant"]
     content: str
@@ -244,3 +294,11 @@ class Example(FullyValidatedModel):
                 return message.content
         msg = "Assistant message not found!"
         raise ValueError(msg)
+
+    def count_tokens(self, encoding: Encoding) -> int:
+        # Based on https://cookbook.openai.com/examples/how_to_count_tokens_with_tiktoken
+        # and https://cookbook.openai.com/examples/chat_finetuning_data_prep
+        tokens = len(encoding.encode("assistant"))  # every reply is primed with <|start|>assistant<|message|>
+        for message in self.messages:
+            tokens += 4 + len(encoding.encode(message.content))
+        return tokens
@@ -0,0 +1,137 @@
+from datetime import datetime
+from functools import partial
+from io import StringIO
+from os import environ
+from pathlib import Path
+from pstats import SortKey, Stats
+from sys import _current_frames, _getframe  # pyright: ignore[reportPrivateUsage]
+from threading import Event, Thread, get_ident
+from time import perf_counter
+from tracemalloc import get_traced_memory
+from tracemalloc import start as start_tracemalloc
+from tracemalloc import stop as stop_tracemalloc
+from typing import TYPE_CHECKING, Any, Self
+
+from tumblrbot.utils.common import config, console
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from types import FrameType
+
+PROFILE_ENVIRONMENT_VARIABLE = "TUMBLRBOT_PROFILE"
+TOP_FUNCTION_COUNT = 15
+SAMPLE_INTERVAL = 0.005
+# Samples that are only waiting are not counted, so idle threads do not hide the functions that are actually slow.
+# Threads block inside these modules while waiting on locks, queues, or the network. Idle thread pool workers block inside _worker itself.
+WAITING_MODULES = frozenset({"threading", "queue", "selectors", "socket", "ssl"})
+WAITING_FUNCTIONS = frozenset({("thread", "_worker")})
+
+# The same formats that pstats uses: (file name, line number, function name) and (primitive calls, calls, own time, total time, callers).
+FunctionKey = tuple[str, int, str]
+FunctionStats = tuple[int, int, float, float, dict[FunctionKey, tuple[int, int, float, float]]]
+
+
+class SamplingProfiler:
+    # cProfile can only run once at a time on newer versions of Python, and it mixes up the calls of threads that run at the same time.
+    # Instead, the stack of the action's thread and every thread it starts is recorded at a fixed interval, so time spent in worker threads is counted for the right functions.
+    # Call counts are the number of samples each function was seen in, and times are wall-clock times spent outside of waiting.
+    def __init__(self, root_frame: FrameType) -> None:
+        # The action's own thread is only recorded up to the frame that started profiling, so the menu and this module are left out.
+        self.root_frame = root_frame
+        self.stats: dict[FunctionKey, FunctionStats] = {}
+        self.ignored_thread_ids: set[int] = set()
+        self.stop_event = Event()
+        self.thread = Thread(target=self.run, daemon=True)
+
+    def __enter__(self) -> Self:
+        # Threads that were already running have nothing to do with the action.
+        self.ignored_thread_ids = set(_current_frames()) - {get_ident()}
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_args: object) -> None:
+        self.stop_event.set()
+        self.thread.join()
+
+    def run(self) -> None:
+        self.ignored_thread_ids.add(get_ident())
+        last_sample = perf_counter()
+        while not self.stop_event.wait(SAMPLE_INTERVAL):
+            now = perf_counter()
+            for thread_id, frame in _current_frames().items():
+                if thread_id not in self.ignored_thread_ids and not self.is_waiting(frame):
+                    self.record(frame, now - last_sample)
+            last_sample = now
+
+    @staticmethod
+    def is_waiting(frame: FrameType) -> bool:
+        module = Path(frame.f_code.co_filename).stem
+        return module in WAITING_MODULES or (module, frame.f_code.co_qualname) in WAITING_FUNCTIONS
+
+    def record(self, leaf_frame: FrameType, elapsed: float) -> None:
+        stack: list[FunctionKey] = []
+        frame = leaf_frame
+        while frame is not None and frame is not self.root_frame:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_qualname))
+            frame = frame.f_back
+
+        # Recursive functions are only counted once per sample.
+        seen: set[FunctionKey] = set()
+        for index, function in enumerate(stack):
+            primitive_calls, calls, own_time, total_time, callers = self.stats.get(function, (0, 0, 0, 0, {}))
+            own_elapsed = elapsed if index == 0 else 0
+            if function not in seen:
+                seen.add(function)
+                primitive_calls += 1
+                calls += 1
+                total_time += elapsed
+            own_time += own_elapsed
+
+            if index + 1 < len(stack):
+                caller = stack[index + 1]
+                caller_primitive_calls, caller_calls, caller_own_time, caller_total_time = callers.get(caller, (0, 0, 0, 0))
+                callers[caller] = (caller_primitive_calls + 1, caller_calls + 1, caller_own_time + own_elapsed, caller_total_time + elapsed)
+
+            self.stats[function] = (primitive_calls, calls, own_time, total_time, callers)
+
+    def create_stats(self) -> None:
+        # This is called by pstats to load the profile.
+        pass
+
+
+def is_profiling_enabled() -> bool:
+    return config.profile_actions or environ.get(PROFILE_ENVIRONMENT_VARIABLE, "").lower() not in {"", "0", "false"}
+
+
+def get_action_name(action: Callable[[], Any]) -> str:
+    while isinstance(action, partial):
+        action = action.func  # pyright: ignore[reportUnknownMemberType]
+    return getattr(action, "__qualname__", type(action).__name__)
+
+
+def run_profiled(action: Callable[[], Any]) -> None:
+    # The action's thread is profiled along with any worker threads it starts. Peak memory includes every thread.
+    name = get_action_name(action)
+    config.profiles_directory.mkdir(parents=True, exist_ok=True)
+    profile_path = config.profiles_directory / f"{datetime.now().astimezone():%Y%m%d-%H%M%S}-{name}.prof"
+
+    profiler = SamplingProfiler(_getframe())
+    start_tracemalloc()
+    try:
+        with profiler:
+            action()
+    finally:
+        _, peak_memory = get_traced_memory()
+        stop_tracemalloc()
+
+        stream = StringIO()
+        stats = Stats(profiler, stream=stream)
+        stats.dump_stats(profile_path)
+        stats.strip_dirs().sort_stats(SortKey.TIME).print_stats(TOP_FUNCTION_COUNT)
+        summary = f"{stream.getvalue().strip()}\n\nCalls are samples taken every {SAMPLE_INTERVAL * 1000:g} ms from the action's threads, not counting time spent waiting.\nPeak memory: {peak_memory / 1024 / 1024:.1f} MiB"
+        profile_path.with_suffix(".txt").write_text(f"{summary}\n", encoding="utf_8")
+
+        console.rule(f"Profile: {name}")
+        console.print(summary, markup=False, highlight=False)
+        console.print(f"[gray62]Full profile saved to '{profile_path}'.")
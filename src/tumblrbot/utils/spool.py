@@ -0,0 +1,90 @@
+from threading import Lock
+from typing import TYPE_CHECKING, Literal
+
+from tumblrbot.utils.models import SpooledDraft
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from tumblrbot.utils.models import Post
+
+UploadState = Literal["uploading", "failed", "uploaded"]
+
+
+class DraftSpool:
+    # Generated drafts are appended to the spool file as soon as they are generated.
+    # Every upload attempt is appended to a second file as a state and an ID, and the last state of each draft is the one that counts:
+    # - "uploading" is written right before each request, so a draft whose request never got an answer is not uploaded again.
+    # - "failed" is written when Tumblr answers with an error, so the draft is known to not have been uploaded and will be tried again.
+    # - "uploaded" is written once Tumblr accepts the draft.
+    # Neither file is ever rewritten, so a crash can at most leave an incomplete last line behind, which is removed when the spool is opened.
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.uploads_path = path.with_name(f"{path.name}.uploads")
+        self.lock = Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # IDs start over when the spool is deleted, so upload states from an old spool must not carry over.
+        if not self.path.exists():
+            self.uploads_path.unlink(missing_ok=True)
+        for file_path in (self.path, self.uploads_path):
+            self.repair(file_path)
+
+        self.next_id = max((draft.id + 1 for draft in self.read_drafts()), default=0)
+
+    def repair(self, path: Path) -> None:
+        if path.exists() and not (data := path.read_bytes()).endswith(b"\n"):
+            with path.open("r+b") as fp:
+                fp.truncate(data.rfind(b"\n") + 1)
+
+    def read_lines(self, path: Path) -> list[bytes]:
+        return path.read_bytes().splitlines() if path.exists() else []
+
+    def read_drafts(self) -> list[SpooledDraft]:
+        return list(map(SpooledDraft.model_validate_json, self.read_lines(self.path)))
+
+    def read_states(self) -> dict[int, str]:
+        states: dict[int, str] = {}
+        for line in self.read_lines(self.uploads_path):
+            state, draft_id = line.decode().split()
+            states[int(draft_id)] = state
+        return states
+
+    def get_pending(self) -> list[SpooledDraft]:
+        states = self.read_states()
+        return [draft for draft in self.read_drafts() if states.get(draft.id, "failed") == "failed"]
+
+    def resolve_unconfirmed(self) -> list[SpooledDraft]:
+        # Returns the drafts whose request was sent without getting an answer before the program was closed, which may or may not have been uploaded.
+        # They are never uploaded again, so they are marked as uploaded to only be returned once.
+        with self.lock:
+            states = self.read_states()
+            unconfirmed = [draft for draft in self.read_drafts() if states.get(draft.id) == "uploading"]
+            for draft in unconfirmed:
+                self.write_state(draft, "uploaded")
+        return unconfirmed
+
+    def append(self, post: Post) -> SpooledDraft:
+        with self.lock:
+            draft = SpooledDraft(id=self.next_id, post=post)
+            self.write_line(self.path, draft.model_dump_json())
+            self.next_id += 1
+        return draft
+
+    def mark(self, draft: SpooledDraft, state: UploadState) -> None:
+        with self.lock:
+            self.write_state(draft, state)
+
+    def clear_if_done(self) -> None:
+        with self.lock:
+            if not self.get_pending():
+                self.path.unlink(missing_ok=True)
+                self.uploads_path.unlink(missing_ok=True)
+                self.next_id = 0
+
+    def write_state(self, draft: SpooledDraft, state: UploadState) -> None:
+        self.write_line(self.uploads_path, f"{state} {draft.id}")
+
+    def write_line(self, path: Path, line: str) -> None:
+        with path.open("a", encoding="utf_8") as fp:
+            fp.write(f"{line}\n")
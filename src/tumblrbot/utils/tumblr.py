@@ -1,25 +1,49 @@
+from typing import TYPE_CHECKING, override
+
+from httpx import AsyncClient, Auth, HTTPStatusError, Limits, Request
+from httpx import Response as AsyncResponse
+from oauthlib.oauth1 import Client
 from requests import HTTPError, Response, Session
 from requests_oauthlib import OAuth1
 from rich import print as rich_print
-from tenacity import RetryCallState, retry, retry_if_exception_message
+from tenacity import RetryCallState, retry, retry_if_exception, retry_if_exception_message
 
 from tumblrbot.utils.common import localize_number
 from tumblrbot.utils.models import Post, ResponseModel, Tokens
 
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+# The maximum number of posts returned by a single request, which is also the default.
+POSTS_PER_PAGE = 20
+
 
 def wait_until_ratelimit_reset(retry_state: RetryCallState) -> float:
     if retry_state.outcome is not None:
         exception = retry_state.outcome.exception()
-        if isinstance(exception, HTTPError):
+        if isinstance(exception, HTTPError | HTTPStatusError):
             ratelimit_type = "day" if exception.response.headers["X-Ratelimit-Perday-Remaining"] == "0" else "hour"
             return float(exception.response.headers[f"X-Ratelimit-Per{ratelimit_type}-Reset"])
     return 0
 
 
+def print_ratelimit_wait(retry_state: RetryCallState) -> None:
+    rich_print(f"[bold yellow]Tumblr rate limit exceeded. Waiting for {localize_number(retry_state.upcoming_sleep)} seconds...")
+
+
+def is_ratelimit_error(exception: BaseException) -> bool:
+    return isinstance(exception, HTTPStatusError) and exception.response.status_code == 429  # noqa: PLR2004
+
+
 rate_limit_retry = retry(
     wait=wait_until_ratelimit_reset,
     retry=retry_if_exception_message(match="429 Client Error: Limit Exceeded for url: .+"),
-    before_sleep=lambda state: rich_print(f"[bold yellow]Tumblr rate limit exceeded. Waiting for {localize_number(state.upcoming_sleep)} seconds..."),
+    before_sleep=print_ratelimit_wait,
+)
+async_rate_limit_retry = retry(
+    wait=wait_until_ratelimit_reset,
+    retry=retry_if_exception(is_ratelimit_error),
+    before_sleep=print_ratelimit_wait,
 )
 
 
@@ -62,6 +86,7 @@ class TumblrSession(Session):
                 "api_key": self.api_key,
                 "offset": offset,
                 "after": after,
+                "limit": POSTS_PER_PAGE,
                 "sort": "asc",
                 "npf": True,
             },
@@ -70,6 +95,10 @@ class TumblrSession(Session):
 
     @rate_limit_retry
     def create_post(self, blog_identifier: str, post: Post) -> ResponseModel:
+        return self.send_post(blog_identifier, post)
+
+    def send_post(self, blog_identifier: str, post: Post) -> ResponseModel:
+        # This makes a single attempt, so callers can keep track of each attempt themselves.
         response = self.post(
             f"https://api.tumblr.com/v2/blog/{blog_identifier}/posts",
             json=post.model_dump(),
@@ -80,3 +109,91 @@ class TumblrSession(Session):
     def get_user_information(self) -> ResponseModel:
         response = self.get("https://api.tumblr.com/v2/user/info")
         return ResponseModel.model_validate_json(response.text)
+
+
+class AsyncOAuth1(Auth):
+    def __init__(self, tokens: Tokens) -> None:
+        self.client = Client(**tokens.tumblr.model_dump())
+
+    @override
+    def auth_flow(self, request: Request) -> Generator[Request, AsyncResponse]:
+        # JSON bodies are not included in the signature, which is the same as OAuth1 for requests.
+        _, headers, _ = self.client.sign(str(request.url), request.method)
+        request.headers.update(headers)
+        yield request
+
+
+class AsyncTumblrSession(AsyncClient):
+    def __init__(
+        self,
+        tokens: Tokens,
+        *,
+        base_url: str = "https://api.tumblr.com/v2/",
+        max_connections: int = 10,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30,
+    ) -> None:
+        super().__init__(
+            auth=AsyncOAuth1(tokens),
+            base_url=base_url,
+            headers={"Accept-Encoding": "gzip"},
+            limits=Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections, keepalive_expiry=keepalive_expiry),
+            timeout=None,
+            event_hooks={"response": [self.response_hook]},
+        )
+
+        self.api_key = tokens.tumblr.client_key
+
+    async def response_hook(self, response: AsyncResponse) -> None:
+        try:
+            response.raise_for_status()
+        except HTTPStatusError as error:
+            await response.aread()
+            for error_msg in response.json()["errors"]:
+                error.add_note(f"{error_msg['code']}: {error_msg['detail']}")
+            raise
+
+    @async_rate_limit_retry
+    async def retrieve_blog_info(self, blog_identifier: str) -> ResponseModel:
+        response = await self.get(
+            f"blog/{blog_identifier}/info",
+            params={
+                "api_key": self.api_key,
+            },
+        )
+        return ResponseModel.model_validate_json(response.text)
+
+    @async_rate_limit_retry
+    async def retrieve_published_posts(
+        self,
+        blog_identifier: str,
+        offset: int | None = None,
+        after: int | None = None,
+    ) -> ResponseModel:
+        params = {
+            "api_key": self.api_key,
+            "offset": offset,
+            "after": after,
+            "limit": POSTS_PER_PAGE,
+            "sort": "asc",
+            "npf": True,
+        }
+        response = await self.get(
+            f"blog/{blog_identifier}/posts",
+            # Unlike requests, httpx sends parameters that are None as empty values.
+            params={key: value for key, value in params.items() if value is not None},
+        )
+        return ResponseModel.model_validate_json(response.text)
+
+    @async_rate_limit_retry
+    async def create_post(self, blog_identifier: str, post: Post) -> ResponseModel:
+        response = await self.post(
+            f"blog/{blog_identifier}/posts",
+            json=post.model_dump(),
+        )
+        return ResponseModel.model_validate_json(response.text)
+
+    @async_rate_limit_retry
+    async def get_user_information(self) -> ResponseModel:
+        response = await self.get("user/info")
+        return ResponseModel.model_validate_json(response.text)
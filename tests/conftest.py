@@ -0,0 +1,18 @@
+from os import chdir
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+
+# Importing tumblrbot loads the config from the working directory and saves it back, so tests are run from an empty directory.
+working_directory = TemporaryDirectory()
+original_directory = Path.cwd()
+
+
+def pytest_sessionstart(session: pytest.Session) -> None:  # noqa: ARG001
+    chdir(working_directory.name)
+
+
+def pytest_sessionfinish(session: pytest.Session) -> None:  # noqa: ARG001
+    chdir(original_directory)
+    working_directory.cleanup()
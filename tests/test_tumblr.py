@@ -0,0 +1,114 @@
+from asyncio import run
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from threading import Thread
+from typing import TYPE_CHECKING, ClassVar, override
+
+import pytest
+from httpx import HTTPStatusError
+
+from tumblrbot.utils.models import Tokens
+from tumblrbot.utils.tumblr import AsyncTumblrSession
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+TOKENS = Tokens.model_construct(
+    openai_api_key="openai",
+    tumblr=Tokens.Tumblr(
+        client_key="client-key",
+        client_secret="client-secret",
+        resource_owner_key="owner-key",
+        resource_owner_secret="owner-secret",
+    ),
+)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Each path is answered with a list of responses in order, and every request is recorded.
+    responses: ClassVar[dict[str, list[tuple[int, dict[str, str], object]]]] = {}
+    requests: ClassVar[list[tuple[str, str | None]]] = []
+
+    def do_GET(self) -> None:
+        self.requests.append((self.path, self.headers["Authorization"]))
+
+        status, headers, body = self.responses[self.path.split("?")[0]].pop(0)
+        data = dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    @override
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        pass
+
+
+@pytest.fixture
+def base_url() -> Generator[str]:
+    StubHandler.responses.clear()
+    StubHandler.requests.clear()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/v2/"
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def test_requests_are_signed(base_url: str) -> None:
+    StubHandler.responses["/v2/user/info"] = [(200, {}, {"response": {"user": {"blogs": [{"name": "blog"}]}}})]
+
+    async def request() -> None:
+        async with AsyncTumblrSession(TOKENS, base_url=base_url) as session:
+            response = await session.get_user_information()
+        assert response.response.user.blogs[0].name == "blog"
+
+    run(request())
+
+    ((_, authorization),) = StubHandler.requests
+    assert authorization is not None
+    assert authorization.startswith("OAuth ")
+    assert 'oauth_consumer_key="client-key"' in authorization
+    assert 'oauth_token="owner-key"' in authorization
+    assert 'oauth_signature_method="HMAC-SHA1"' in authorization
+    assert "oauth_signature=" in authorization
+
+
+def test_rate_limit_is_retried(base_url: str) -> None:
+    rate_limit_headers = {"X-Ratelimit-Perday-Remaining": "100", "X-Ratelimit-Perhour-Reset": "0"}
+    StubHandler.responses["/v2/blog/blog/info"] = [
+        (429, rate_limit_headers, {"errors": [{"code": 0, "detail": "Limit Exceeded"}]}),
+        (200, {}, {"response": {"blog": {"name": "blog", "posts": 5}}}),
+    ]
+
+    async def request() -> None:
+        async with AsyncTumblrSession(TOKENS, base_url=base_url) as session:
+            response = await session.retrieve_blog_info("blog")
+        assert response.response.blog.posts == 5  # noqa: PLR2004
+
+    run(request())
+
+    assert len(StubHandler.requests) == 2  # noqa: PLR2004
+    assert all("api_key=client-key" in path for path, _ in StubHandler.requests)
+
+
+def test_errors_include_details(base_url: str) -> None:
+    StubHandler.responses["/v2/blog/missing/info"] = [(404, {}, {"errors": [{"code": 4012, "detail": "Blog not found"}]})]
+
+    async def request() -> None:
+        async with AsyncTumblrSession(TOKENS, base_url=base_url) as session:
+            await session.retrieve_blog_info("missing")
+
+    with pytest.raises(HTTPStatusError) as exception_info:
+        run(request())
+
+    assert exception_info.value.response.status_code == 404  # noqa: PLR2004
+    assert "4012: Blog not found" in exception_info.value.__notes__